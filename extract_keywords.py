@@ -17,6 +17,9 @@ from tqdm import tqdm
 # PARALLEL
 from joblib import Parallel,delayed
 
+# SAMPLING
+from sampling import stratified_sample, estimate_frequencies
+
 ############################################################################
 #                        NLP FUNCTION
 ############################################################################
@@ -69,39 +72,219 @@ def if_in(keywords,text):
 
 
 
+def load_keywords(question_id,prefix="question"):
+    """
+    Return the keywords of the terminology saved for a question
+    
+    Parameters
+    ----------
+    question_id : int
+        question id
+    prefix : str, optional
+        prefix of the terminology filename, by default "question"
+    
+    Returns
+    -------
+    set of str
+        keywords
+    """
+    term_i = pd.read_csv("./terminologies_extracted/{0}_{1}.csv".format(prefix,question_id))
+    kw = term_i.term.values.tolist()
+    kw = [str(k) for k in kw]
+    return set([k for k in kw if len(k)>2 and (k not in fr_stop)])
+
+
+def annotate(keywords,texts):
+    """
+    Return keywords found in each text
+    
+    Parameters
+    ----------
+    keywords : set of str
+        keywords
+    texts : list of str
+        texts
+    
+    Returns
+    -------
+    list of str
+        keywords found in each text, separated by a pipe
+    """
+    return Parallel(n_jobs=-1,backend="multiprocessing")(delayed(if_in)(keywords,x) for x in tqdm(texts))
+
+
+def no_keyword_counts(texts,annotations):
+    """
+    Return the number of non-empty texts, and the number of those in which no keyword of the terminology was found
+    
+    Parameters
+    ----------
+    texts : list of str
+        texts
+    annotations : list of str
+        keywords found in each text, as returned by `annotate()`
+    
+    Returns
+    -------
+    tuple of int
+        number of non-empty texts, number of non-empty texts without keyword
+    """
+    not_empty = [a for t,a in zip(texts,annotations) if str(t).strip()]
+    return len(not_empty),sum(1 for a in not_empty if not a)
+
+
+def load_drift_state(question_id):
+    """
+    Return the drift state of a question saved next to its terminology, or None
+    
+    The state contains the share of non-empty responses without keyword when the terminology was last
+    computed ("no_keyword_share"), and the responses annotated since ("new_rows", "new_no_keyword").
+    """
+    filename = "./terminologies_extracted/question_{0}_state.json".format(question_id)
+    if not os.path.exists(filename):
+        return None
+    return json.load(open(filename))
+
+
+def save_drift_state(question_id,state):
+    json.dump(state,open("./terminologies_extracted/question_{0}_state.json".format(question_id),"w"))
+
+
+def reset_drift_state(question_id,texts,annotations):
+    """
+    Save a new drift state of a question from the texts annotated with its (new) terminology
+    """
+    n,n_no_kw = no_keyword_counts(texts,annotations)
+    save_drift_state(question_id,{"no_keyword_share":n_no_kw/n if n else 0.,"new_rows":0,"new_no_keyword":0})
+
+
 ############################################################################
 #                        MAIN CODE
 ############################################################################
 import argparse 
+import os
 
 parser = argparse.ArgumentParser()
 
 parser.add_argument("input_data")
 parser.add_argument("question_data")
+parser.add_argument("--incremental",action="store_true",help="annotate only contributions absent from the previous output")
+parser.add_argument("--id_column",default="id",help="column containing the contribution id")
+parser.add_argument("--drift_threshold",type=float,default=0.2,help="increase of the share of responses without any keyword, since the last terminology computation, above which a question terminology is recomputed")
+parser.add_argument("--drift_min_rows",type=int,default=100,help="minimum number of non-empty responses annotated since the last terminology computation before the drift of a question can trigger a recompute")
+parser.add_argument("--sample_fraction",type=float,help="process only this fraction of the responses of each question and estimate keyword frequencies")
+parser.add_argument("--sample_size",type=int,help="process only this number of responses of each question and estimate keyword frequencies")
+parser.add_argument("--seed",type=int,default=42,help="random seed of the sampling")
+parser.add_argument("--sample_terminology",action="store_true",help="in sampling mode, extract the terminology from the sample even if a full-run terminology exists")
 
-args = parser.parse_args("./LA_TRANSITION_ECOLOGIQUE.csv ./questionsTRANSITION.json".split())
+args = parser.parse_args()
 
-df = pd.read_csv(args.input_data,dtype={"authorZipCode":str})
+df = pd.read_csv(args.input_data,dtype={"authorZipCode":str,args.id_column:str})
 df = df.fillna("")
 
 data_questions = json.load(open(args.question_data))
 
 df.rename(columns=data_questions["all_question"],inplace=True)
+questions = range(1,len(data_questions["all_question"])+1)
 
-# EXTRACT and SAVE terminology extracted for each question
-for i in tqdm(range(1,len(data_questions["all_question"])+1)):
-    termi_i = extract_and_treat_keywords_terminology(df[i].values)
-    termi_i.to_csv("./terminologies_extracted/question_{0}.csv".format(i))
+output_filename = "{0}_with_keywords.csv".format(args.input_data.replace(".csv",""))
 
-for i in tqdm(range(1,len(data_questions["all_question"])+1)):
-    term_i = pd.read_csv("./terminologies_extracted/question_{0}.csv".format(i))
-    kw = term_i.term.values.tolist()
-    kw = [str(k) for k in kw]
-    kw = set([k for k in kw if len(k)>2 and (k not in fr_stop)])
-    df["{0}_kw".format(i)]=Parallel(n_jobs=-1,backend="multiprocessing")(delayed(if_in)(kw,x) for x in tqdm(df[i].values))
+if args.sample_fraction is not None or args.sample_size is not None:
+    # Each question is a stratum containing its non-empty responses
+    responses = pd.concat([
+        pd.DataFrame({"question":i,"response":df.index[df[i] != ""],"text":df[i][df[i] != ""].values})
+        for i in questions
+    ])
+    population = responses.groupby("question").size()
+    sample = stratified_sample(responses,"question",fraction=args.sample_fraction,size=args.sample_size,seed=args.seed)
+    sample_sizes = sample.groupby("question").size()
+
+    records,terminology_used = [],{}
+    for i in tqdm(questions):
+        sample_i = sample[sample.question == i]
+        if not len(sample_i):
+            continue
+        # The full-run terminology is used when available, so that estimates are unbiased and
+        # comparable with a full run. Otherwise, it is extracted from the sample and saved apart.
+        prefix = "question"
+        if args.sample_terminology or not os.path.exists("./terminologies_extracted/question_{0}.csv".format(i)):
+            prefix = "sample_question"
+            termi_i = extract_and_treat_keywords_terminology(sample_i.text.values)
+            termi_i.to_csv("./terminologies_extracted/sample_question_{0}.csv".format(i))
+        terminology_used[i] = "{0}_{1}.csv".format(prefix,i)
+        print("Question {0} : terminology {1}".format(i,terminology_used[i]))
+        found = annotate(load_keywords(i,prefix=prefix),sample_i.text.values)
+        for response,kws in zip(sample_i.response.values,found):
+            records.extend([i,response,k] for k in kws.split("|") if k)
+
+    records = pd.DataFrame(records,columns=["question","response","keyword"])
+    estimates = estimate_frequencies(records,population,sample_sizes,["keyword"],stratum_column="question",by_stratum=True)
+    estimates["terminology"] = estimates.question.map(terminology_used)
+    estimates.to_csv("{0}_keyword_estimates.csv".format(args.input_data.replace(".csv","")))
+elif args.incremental and os.path.exists(output_filename):
+    # Only the ids and the index of the previous output are needed to find new contributions
+    previous_columns = pd.read_csv(output_filename,nrows=0).columns
+    previous_ids = pd.read_csv(output_filename,index_col=0,usecols=[previous_columns[0],args.id_column],dtype={args.id_column:str})
+    previous_columns = [int(c) if str(c).isdigit() else c for c in previous_columns[1:]]
+
+    # Only contributions absent from the previous output are annotated
+    new_rows = df[~df[args.id_column].isin(previous_ids[args.id_column])].copy()
+    start = previous_ids.index.max()+1 if len(previous_ids) else 0
+    new_rows.index = range(start,start+len(new_rows))
+    print("{0} new contributions".format(len(new_rows)))
+
+    # Annotate with the existing terminology, and flag questions whose terminology drifted : the share of
+    # responses without keyword, accumulated since the last terminology computation, rose above the share
+    # observed at that time. Yes/no questions are never recomputed.
+    to_recompute,states = [],{}
+    for i in tqdm(questions):
+        new_rows["{0}_kw".format(i)]=annotate(load_keywords(i),new_rows[i].values)
+        state = load_drift_state(i)
+        if state is None:
+            previous_i = pd.read_csv(output_filename,usecols=[str(i),"{0}_kw".format(i)],dtype=str).fillna("")
+            n,n_no_kw = no_keyword_counts(previous_i[str(i)].values,previous_i["{0}_kw".format(i)].values)
+            state = {"no_keyword_share":n_no_kw/n if n else 0.,"new_rows":0,"new_no_keyword":0}
+        n,n_no_kw = no_keyword_counts(new_rows[i].values,new_rows["{0}_kw".format(i)].values)
+        state["new_rows"]+=n
+        state["new_no_keyword"]+=n_no_kw
+        states[i] = state
+        if i in data_questions["yes_no_questions"] or state["new_rows"] < args.drift_min_rows:
+            continue
+        if state["new_no_keyword"]/state["new_rows"] - state["no_keyword_share"] > args.drift_threshold:
+            to_recompute.append(i)
+
+    if not to_recompute:
+        # Append new rows to the previous output
+        new_rows.reindex(columns=previous_columns,fill_value="").to_csv(output_filename,mode="a",header=False)
+    else:
+        print("Terminology recomputed for questions :",to_recompute)
+        previous = pd.read_csv(output_filename,index_col=0,dtype={"authorZipCode":str,args.id_column:str})
+        previous = previous.fillna("")
+        previous.rename(columns=lambda c: int(c) if str(c).isdigit() else c,inplace=True)
+        df = pd.concat([previous,new_rows],sort=False).fillna("")
+        for i in tqdm(to_recompute):
+            termi_i = extract_and_treat_keywords_terminology(df[i].values)
+            termi_i.to_csv("./terminologies_extracted/question_{0}.csv".format(i))
+            df["{0}_kw".format(i)]=annotate(load_keywords(i),df[i].values)
+        df.to_csv(output_filename)
+
+    # States are saved once the output is written
+    for i in questions:
+        if i in to_recompute:
+            reset_drift_state(i,df[i].values,df["{0}_kw".format(i)].values)
+        else:
+            save_drift_state(i,states[i])
+else:
+    # EXTRACT and SAVE terminology extracted for each question
+    for i in tqdm(questions):
+        termi_i = extract_and_treat_keywords_terminology(df[i].values)
+        termi_i.to_csv("./terminologies_extracted/question_{0}.csv".format(i))
+
+    for i in tqdm(questions):
+        df["{0}_kw".format(i)]=annotate(load_keywords(i),df[i].values)
 
-# Extract Location from response for each question
-N_questions = len(data_questions["all_question"])
+    ### SAVE Extraction only
+    df.to_csv(output_filename)
 
-### SAVE Extraction only
-df.to_csv("{0}_with_keywords.csv".format(args.input_data.replace(".csv","")))
+    for i in questions:
+        reset_drift_state(i,df[i].values,df["{0}_kw".format(i)].values)
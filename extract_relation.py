@@ -1,3 +1,5 @@
+import re
+
 import numpy as np
 import pandas as pd
 from tqdm import tqdm
@@ -5,9 +7,16 @@ from tqdm import tqdm
 from rulebased import *
 from french_patterns import *
 from corpushelpers import postags
+from relation_graph import RelationGraphBuilder
+from sampling import stratified_sample, estimate_frequencies
 
 from joblib import Parallel,delayed
 
+try:
+    import psutil
+except ImportError:
+    psutil = None # Memory of the joblib workers is not reported
+
 yes_questions = ["QUXVlc3Rpb246MTQ4","QUXVlc3Rpb246MTQ2","QUXVlc3Rpb246MTU0","QUXVlc3Rpb246MTUy","travaux d'isolation|commun|isolation|ans|prix|chauffage"]
 
 
@@ -21,13 +30,103 @@ def prep_4_writing(buffer, question_id,batch_number):
     df = pd.DataFrame(fin_res,columns="Question Contribution Source Target Type TextExtract Start End".split())
     df.to_csv("{0}_{1}.csv".format(question_id,batch_number))
 
+def estimate_tokens(text):
+    """
+    Return an estimation of the number of tokens produced by the tagger for a text (words and punctuation)
+    """
+    return len(re.findall(r"\w+|[^\w\s]",str(text)))
+
+def make_batches(group,text_column,memory_budget,bytes_per_token):
+    """
+    Split responses in batches whose estimated memory cost fits in a memory budget. A response whose
+    estimated cost exceeds the budget is isolated in its own batch.
+    
+    Parameters
+    ----------
+    group : pd.DataFrame
+        responses
+    text_column : str
+        column containing the responses
+    memory_budget : int
+        memory available for a batch (in bytes)
+    bytes_per_token : int
+        estimated memory cost of a token (in bytes)
+    
+    Returns
+    -------
+    list of pd.DataFrame
+        batches
+    """
+    token_budget = max(1,memory_budget//bytes_per_token)
+    n_tokens = group[text_column].apply(estimate_tokens).values
+    batches,current,current_size = [],[],0
+    for pos,n in enumerate(n_tokens):
+        if n > token_budget:
+            print("Response {0} exceeds the memory budget ({1} tokens), isolated in its own batch".format(pos,n))
+            batches.append([pos])
+            continue
+        if current and current_size+n > token_budget:
+            batches.append(current)
+            current,current_size = [],0
+        current.append(pos)
+        current_size+=n
+    if current:
+        batches.append(current)
+    return [group.iloc[b] for b in batches]
+
+def worker_pids():
+    """
+    Return the pids of the joblib worker processes, or None if psutil is not installed. Helper processes
+    such as the loky/multiprocessing resource tracker are left out.
+    """
+    if psutil is None:
+        return None
+    pids = []
+    for p in psutil.Process().children(recursive=True):
+        try:
+            cmdline = " ".join(p.cmdline())
+        except (psutil.NoSuchProcess,psutil.AccessDenied):
+            continue
+        if "resource_tracker" in cmdline or "semaphore_tracker" in cmdline:
+            continue
+        pids.append(p.pid)
+    return pids
+
+def reset_peak_rss(pids=("self",)):
+    """
+    Reset the peak resident set size of the given processes (Linux only)
+    """
+    for pid in pids:
+        try:
+            with open("/proc/{0}/clear_refs".format(pid),"w") as f:
+                f.write("5")
+        except OSError:
+            pass
+
+def peak_rss(pid="self"):
+    """
+    Return the peak resident set size of a process (in bytes) since the last call to `reset_peak_rss()`,
+    or None if it is not available (Linux only)
+    """
+    try:
+        with open("/proc/{0}/status".format(pid)) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])*1024
+    except OSError:
+        pass
+    return None
+
+def format_mb(n_bytes):
+    return "n/a" if n_bytes is None else "{0:.1f} MB".format(n_bytes/1024**2)
+
 def work(data,transf):
-    pos_tag_fin = pip_FR.pipe(data)
+    pos_tag_fin = pip_FR.pipe_many(data)
     if transf:
-        pos_tag_fin = tran_pip.pipe(pos_tag_fin)
+        pos_tag_fin = tran_pip.pipe_many(pos_tag_fin)
     else:
-        pos_tag_fin = eng_pip.pipe(pos_tag_fin)
-    res = pip_rule.pipe(pos_tag_fin)
+        pos_tag_fin = eng_pip.pipe_many(pos_tag_fin)
+    res = [pip_rule.pipe(pos_tag) for pos_tag in pos_tag_fin]
     return res
 
 # READ INPUT
@@ -39,11 +138,23 @@ print("Data Loaded !")
 data= data.fillna("")
 
 
-n_split = 5
+memory_budget = 4*1024**3 # memory available for a batch (in bytes)
+bytes_per_token = 2048 # estimated memory cost of a token during pos-tagging and relation extraction (in bytes)
+chunk_size = 500 # number of documents parsed at once by a worker
+# TaggerBackend used by postags, None for the TreeTagger binary. For the in-process tagger :
+#   from taggers import LexiconTaggerBackend
+#   tagger = LexiconTaggerBackend("lexicon_fr.txt")
+tagger = None
 transf=True
 enga=False
 constat=False
 
+# SAMPLING : if sample_fraction or sample_size is set, only a stratified sample of the responses
+# of each question is processed and relation frequencies are estimated for the full dataset
+sample_fraction = None # e.g. 0.05
+sample_size = None
+sample_seed = 42
+
 #data = pd.read_csv("./sample2.csv",index_col=0)
 
 # Extract KEYWORDS
@@ -51,6 +162,7 @@ kw = data.keywords.unique()
 kw = [str(x).split("|") for x in kw]
 kw = np.unique(np.hstack(kw))
 kw = [i.split() for i in kw if i]
+kw_first_tokens = [k[0] for k in kw]
 
 
 # ----------------------------------------
@@ -83,43 +195,87 @@ je_pip.rules.append(ParsingRule([["je"]],"JE",2))
 
 
 
+# ANCHORS : (column, values) a tagged document must contain to be a candidate for a rule
+kw_anchor = (0,kw_first_tokens)
+det_anchor = (1,[d[0] for d in dets_list])
+adv_anchor = (1,["ADV"])
+tran_anchor = (2,transf_verb)
+enga_anchor = (2,engag_verb)
+
 if transf:
-    pip_rule.rules.append(RelationRule([["TRAN","DET","KW"]],"changement",0,2,2,1))
-    pip_rule.rules.append(RelationRule([["ADV","TRAN","ADV","DET","KW"]],"nepas_changment",1,4,2,1))
+    pip_rule.rules.append(RelationRule([["TRAN","DET","KW"]],"changement",0,2,2,1,anchors=[tran_anchor,det_anchor,kw_anchor]))
+    pip_rule.rules.append(RelationRule([["ADV","TRAN","ADV","DET","KW"]],"nepas_changment",1,4,2,1,anchors=[tran_anchor,adv_anchor,det_anchor,kw_anchor]))
 elif enga:
-    pip_rule.rules.append(RelationRule([["ENGA","DET","KW"]],"engagement",0,2,2,1))
-    pip_rule.rules.append(RelationRule([["ADV","ENGA","ADV","DET","KW"]],"nepas_enga",1,4,2,1))
+    pip_rule.rules.append(RelationRule([["ENGA","DET","KW"]],"engagement",0,2,2,1,anchors=[enga_anchor,det_anchor,kw_anchor]))
+    pip_rule.rules.append(RelationRule([["ADV","ENGA","ADV","DET","KW"]],"nepas_enga",1,4,2,1,anchors=[enga_anchor,adv_anchor,det_anchor,kw_anchor]))
 elif constat:
     #patterns,rule_name,src_position,tar_postion,value_idx=0,pattern_idx=0):
-    pip_rule.rules.append(RelationRule([["KW","ETRE","ADJ"]],"constat",0,2,2,1))
+    pip_rule.rules.append(RelationRule([["KW","ETRE","ADJ"]],"constat",0,2,2,1,anchors=[kw_anchor,(2,["être"]),(1,["ADJ"])]))
+
+# Sample responses
+population = data.groupby("question").size()
+sampling = sample_fraction is not None or sample_size is not None
+if sampling:
+    data = stratified_sample(data,"question",fraction=sample_fraction,size=sample_size,seed=sample_seed)
+    print("Sample of {0} responses".format(len(data)))
+sample_sizes = data.groupby("question").size()
+relation_records = []
 
 # Run Relation Extraction 
 import gc, os
+graph = RelationGraphBuilder()
 for name, group in data.groupby("question"):
     print("Processing question : ",name)
-    splited = np.array_split(group,n_split)
+    splited = make_batches(group,"reponse",memory_budget,bytes_per_token)
     ix=0
     while splited:
         print("Working on Batch",ix)
         data_ix = splited.pop(0)
+        reset_peak_rss(["self"]+(worker_pids() or []))
         # if os.path.exists("{0}_{1}.csv".format(name,ix)):
         #     ix+=1
         #     continue
         print("PosTagging in Progress")
-        data_ix = postags(data_ix,text_column="reponse")
-        print("Extract Relations in Batch",ix)
-        buffer = Parallel(n_jobs=12)(delayed(work)(pos_tag,transf) for ij,pos_tag in tqdm(enumerate(data_ix.pos_tag.values),total=len(data_ix)))
+        index = TaggedCorpusIndex()
+        data_ix = postags(data_ix,text_column="reponse",index=index,tagger=tagger)
+        candidates = pip_rule.candidates(index)
+        print("Extract Relations in Batch",ix,"({0}/{1} candidate documents)".format(len(candidates),len(data_ix)))
+        pos_tags = data_ix.pos_tag.values
+        chunks = [candidates[i:i+chunk_size] for i in range(0,len(candidates),chunk_size)]
+        found = Parallel(n_jobs=12)(delayed(work)(list(pos_tags[chunk]),transf) for chunk in tqdm(chunks))
+        buffer = [[] for _ in range(len(data_ix))]
+        for chunk,res in zip(chunks,found):
+            for ij,rel in zip(chunk,res):
+                buffer[ij] = rel
 
         data_ix['Start'] = pd.to_datetime(data_ix.publishedat).dt.to_period('D')
         data_ix["End"] = data_ix.Start.apply(lambda x: x+1)
         data_ix["rel"] = buffer
+        graph.add((r for rel in buffer for r in rel),name)
+        if sampling:
+            for contribution,rel in zip(data_ix.contribution.values,buffer):
+                relation_records.extend([name,contribution,*r[:3]] for r in rel)
         print("Save Data")
         prep_4_writing(data_ix,name,ix)
         
         print("Data saved")
+        pids = worker_pids()
+        workers_peak = None
+        if pids:
+            peaks = [peak_rss(pid) for pid in pids]
+            workers_peak = sum(p for p in peaks if p is not None) if any(p is not None for p in peaks) else None
+        print("Batch {0} : {1} responses, main-process peak RSS {2}, workers peak RSS (sum over {3} workers) {4}".format(
+            ix,len(data_ix),format_mb(peak_rss()),len(pids) if pids is not None else "n/a",format_mb(workers_peak)))
         gc.collect()
         print("Buffer empty")
         ix+=1
+    graph.save("relation_graph")
     break
 
+if sampling:
+    records = pd.DataFrame(relation_records,columns="Question Contribution Source Target Type".split())
+    estimates = estimate_frequencies(records,population,sample_sizes,["Source","Target","Type"],
+        stratum_column="Question",response_column="Contribution",by_stratum=True)
+    estimates.to_csv("relation_estimates.csv")
+
 
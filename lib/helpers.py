@@ -2,7 +2,7 @@
 Helpers
 """
 
-from treetagger import TreeTagger
+from taggers import TreeTaggerBackend, split_documents
 import numpy as np
 
 
@@ -14,7 +14,7 @@ def parse_output(x):
         x[idx,2]=x[idx,0]
     return x
 
-def postags(data,text_column="reponse",lang="french"):
+def postags(data,text_column="reponse",lang="french",index=None,tagger=None):
     """
     Return TreeTagger Part-Of-Speech outputs for large corpus. 
     
@@ -26,12 +26,19 @@ def postags(data,text_column="reponse",lang="french"):
         {french, spanish, english, ...}, by default "french"
     nb_split : int, optional
         number of text send to TreeTagger at each loop, by default 50
+    index : TaggedCorpusIndex, optional
+        if given, each tagged document is added to the index using its position in `data` as id
+    tagger : TaggerBackend, optional
+        backend used to tag the corpus, by default a `TreeTaggerBackend` for `lang`
     """
-    tree_tagger = TreeTagger(language=lang)
-    res = tree_tagger.tag("\n##############END\n".join(data[text_column].values))
-    res = [r for r in res if len(r) ==3 ]
-    res = np.asarray(res)
-    indexes = np.where(res[:,0]=="##############END")[0]
-    pos_tag_data  = np.asarray([parse_output(i[1:]) for i in np.split(res,indexes)])
+    if tagger is None:
+        tagger = TreeTaggerBackend(language=lang)
+    docs = split_documents(*tagger.tag_many(data[text_column].values))
+    pos_tag_data = np.empty(len(docs),dtype=object)
+    for i,doc in enumerate(docs):
+        pos_tag_data[i] = parse_output(doc.copy())
+    if index is not None:
+        for doc_id,pos_tag in enumerate(pos_tag_data):
+            index.add(doc_id,pos_tag)
     data["pos_tag"] = pos_tag_data
     return data
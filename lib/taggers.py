@@ -0,0 +1,297 @@
+"""
+Tagger backends
+
+A tagger backend tags a batch of texts at once with `tag_many(texts)` and returns columnar arrays
+(tokens, tags, lemmas, offsets) : the tokens of the i-th text are found in tokens[offsets[i]:offsets[i+1]].
+"""
+
+import mmap
+import os
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+
+def split_documents(tokens,tags,lemmas,offsets):
+    """
+    Return the Part-Of-Speech output of each document from the columnar arrays returned by `tag_many()`
+
+    Parameters
+    ----------
+    tokens : 1D array
+        tokens
+    tags : 1D array
+        part-of-speech tags
+    lemmas : 1D array
+        lemmas
+    offsets : 1D array
+        start position of each document in the columns, followed by the total number of tokens
+
+    Returns
+    -------
+    list of 2D array (token,tag,lemma)
+        Post-tags arrays
+    """
+    columns = np.stack([tokens,tags,lemmas],axis=1) if len(tokens) else np.empty((0,3),dtype=str)
+    return [columns[offsets[i]:offsets[i+1]] for i in range(len(offsets)-1)]
+
+
+class TaggerBackend(object):
+    """
+    Abstract class of the tagger backends
+    """
+    def tag_many(self,texts):
+        """
+        Tag a batch of texts
+
+        Parameters
+        ----------
+        texts : list of str
+            corpus
+
+        Returns
+        -------
+        tuple of 1D array
+            tokens, tags, lemmas and offsets
+        """
+        raise NotImplementedError("TaggerBackend is an abstract class")
+
+    def tag(self,text):
+        """
+        Tag a single text
+
+        Parameters
+        ----------
+        text : str
+            text
+
+        Returns
+        -------
+        2D array (token,tag,lemma)
+            Post-tags array
+        """
+        return split_documents(*self.tag_many([text]))[0]
+
+
+class TreeTaggerBackend(TaggerBackend):
+    """
+    Backend based on the TreeTagger binary. Texts of a batch are sent to a single TreeTagger process,
+    separated by a marker token.
+    """
+    END_MARKER = "##############END"
+
+    def __init__(self,language="french",**kwargs):
+        """
+        TreeTaggerBackend constructor
+
+        Parameters
+        ----------
+        language : str, optional
+            {french, spanish, english, ...}, by default "french"
+        **kwargs
+            arguments given to `TreeTagger`
+        """
+        from treetagger import TreeTagger
+        self.tree_tagger = TreeTagger(language=language,**kwargs)
+
+    def tag_many(self,texts):
+        res = self.tree_tagger.tag(("\n{0}\n".format(self.END_MARKER)).join(texts))
+        res = np.asarray([r for r in res if len(r) == 3])
+        if not len(res):
+            return np.array([]),np.array([]),np.array([]),np.zeros(len(texts)+1,dtype=int)
+        is_marker = res[:,0] == self.END_MARKER
+        markers = np.where(is_marker)[0]
+        # Shift each document start by the number of markers removed before it
+        starts = markers - np.arange(len(markers))
+        offsets = np.concatenate([[0],starts,[len(res)-len(markers)]]).astype(int)
+        res = res[~is_marker]
+        return res[:,0],res[:,1],res[:,2],offsets
+
+
+class CachedTaggerBackend(TaggerBackend):
+    """
+    Wrap a backend and keep the output of the most recently tagged texts in memory. Only the texts
+    missing from the cache are sent to the wrapped backend.
+    """
+    def __init__(self,backend,maxsize=100000):
+        """
+        CachedTaggerBackend constructor
+
+        Parameters
+        ----------
+        backend : TaggerBackend
+            wrapped backend
+        maxsize : int, optional
+            maximum number of texts kept in the cache, by default 100000
+        """
+        self.backend = backend
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+
+    def tag_many(self,texts):
+        missing = list(OrderedDict.fromkeys(t for t in texts if not t in self.cache))
+        if missing:
+            for text,pos_tags in zip(missing,split_documents(*self.backend.tag_many(missing))):
+                self.cache[text] = pos_tags
+        docs = []
+        for text in texts:
+            self.cache.move_to_end(text)
+            docs.append(self.cache[text])
+        while len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+
+        lengths = [len(d) for d in docs]
+        offsets = np.concatenate([[0],np.cumsum(lengths)]).astype(int)
+        if not sum(lengths):
+            return np.array([]),np.array([]),np.array([]),offsets
+        columns = np.concatenate([d for d in docs if len(d)])
+        return columns[:,0],columns[:,1],columns[:,2],offsets
+
+
+def write_lexicon(entries,path):
+    """
+    Write a lexicon file readable by `LexiconTaggerBackend`. Each line follows the TreeTagger lexicon
+    format : "word<TAB>tag lemma<TAB>tag lemma...", and lines are sorted by word.
+
+    Parameters
+    ----------
+    entries : dict
+        word -> list of (tag,lemma), the first pair being the one used by the tagger
+    path : str
+        output filename
+    """
+    lines = sorted(
+        (word.encode("utf-8"),"\t".join("{0} {1}".format(t,l) for t,l in analyses).encode("utf-8"))
+        for word,analyses in entries.items() if analyses
+    )
+    with open(path,"wb") as f:
+        for word,analyses in lines:
+            f.write(word + b"\t" + analyses + b"\n")
+
+
+class LexiconTaggerBackend(TaggerBackend):
+    """
+    In-process tagger : texts are tokenized with a regular expression and each token gets the first
+    analysis found in a lexicon file. Faster than TreeTagger, but without disambiguation.
+
+    The lexicon file is memory-mapped and searched by dichotomy, so it must be sorted by word (see
+    `write_lexicon()`).
+    """
+    TOKEN_REGEX = re.compile(r"[^\W\d_]+['’]|\d+(?:[.,]\d+)*|\w+(?:-\w+)*|[^\w\s]")
+    SENT_PUNCT = set(".!?")
+
+    def __init__(self,lexicon_path,unknown_tag="NOM",num_tag="NUM",pun_tag="PUN",sent_tag="SENT"):
+        """
+        LexiconTaggerBackend constructor
+
+        Parameters
+        ----------
+        lexicon_path : str
+            lexicon filename
+        unknown_tag : str, optional
+            tag given to words absent from the lexicon, by default "NOM"
+        num_tag : str, optional
+            tag given to unknown numbers, by default "NUM"
+        pun_tag : str, optional
+            tag given to unknown punctuation, by default "PUN"
+        sent_tag : str, optional
+            tag given to unknown sentence-ending punctuation, by default "SENT"
+
+        Raises
+        ------
+        ValueError
+            If the lexicon file is empty or not sorted by word
+        """
+        if os.path.getsize(lexicon_path) == 0:
+            raise ValueError("Lexicon file {0} is empty.".format(lexicon_path))
+        self.unknown_tag = unknown_tag
+        self.num_tag,self.pun_tag,self.sent_tag = num_tag,pun_tag,sent_tag
+        self.lookup_cache = {}
+
+        self._file = open(lexicon_path,"rb")
+        self.lexicon = mmap.mmap(self._file.fileno(),0,access=mmap.ACCESS_READ)
+        buffer = np.frombuffer(self.lexicon,dtype=np.uint8)
+        ends = np.flatnonzero(buffer == ord("\n"))
+        if len(buffer) and buffer[-1] != ord("\n"):
+            ends = np.append(ends,len(buffer))
+        self.line_ends = ends
+        self.line_starts = np.concatenate([[0],ends[:-1]+1]).astype(int)
+        del buffer
+
+        # The dichotomic search silently misses words if the lexicon is not sorted
+        previous = None
+        for i in range(len(self.line_starts)):
+            key = self._line(i).split(b"\t",1)[0]
+            if previous is not None and key < previous:
+                self.close()
+                raise ValueError("Lexicon file {0} is not sorted by word (line {1}), use write_lexicon() to sort it.".format(lexicon_path,i+1))
+            previous = key
+
+    def _line(self,i):
+        return self.lexicon[self.line_starts[i]:self.line_ends[i]]
+
+    def _search(self,word):
+        """
+        Return the first analysis (tag,lemma) of a word in the lexicon, or None
+        """
+        key = word.encode("utf-8")
+        low,high = 0,len(self.line_starts)
+        while low < high:
+            mid = (low+high)//2
+            line = self._line(mid)
+            entry = line.split(b"\t",1)
+            if entry[0] < key:
+                low = mid+1
+            elif entry[0] > key:
+                high = mid
+            else:
+                if len(entry) < 2:
+                    return None
+                analysis = entry[1].split(b"\t",1)[0].decode("utf-8").split(" ",1)
+                return analysis[0],(analysis[1] if len(analysis) > 1 else word)
+        return None
+
+    def lookup(self,token):
+        """
+        Return the tag and the lemma of a token
+
+        Parameters
+        ----------
+        token : str
+            token
+
+        Returns
+        -------
+        tuple of str
+            tag, lemma
+        """
+        if token in self.lookup_cache:
+            return self.lookup_cache[token]
+        analysis = self._search(token)
+        if analysis is None and token != token.lower():
+            analysis = self._search(token.lower())
+        if analysis is None:
+            if token[0].isdigit():
+                analysis = (self.num_tag,"@card@")
+            elif not token[0].isalnum() and token[0] != "_":
+                analysis = (self.sent_tag if token in self.SENT_PUNCT else self.pun_tag,token)
+            else:
+                analysis = (self.unknown_tag,"<unknown>")
+        self.lookup_cache[token] = analysis
+        return analysis
+
+    def tag_many(self,texts):
+        tokens,tags,lemmas,offsets = [],[],[],[0]
+        for text in texts:
+            for token in self.TOKEN_REGEX.findall(text):
+                tag,lemma = self.lookup(token)
+                tokens.append(token)
+                tags.append(tag)
+                lemmas.append(lemma)
+            offsets.append(len(tokens))
+        return np.asarray(tokens),np.asarray(tags),np.asarray(lemmas),np.asarray(offsets,dtype=int)
+
+    def close(self):
+        self.lexicon.close()
+        self._file.close()
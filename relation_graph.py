@@ -0,0 +1,239 @@
+import numpy as np
+import scipy.sparse as sp
+
+
+def resize_csr(matrix,n):
+    """
+    Return a square CSR matrix of size `n` containing `matrix` in its upper-left corner
+
+    Parameters
+    ----------
+    matrix : sp.csr_matrix
+        matrix, of size <= n
+    n : int
+        new size
+
+    Returns
+    -------
+    sp.csr_matrix
+        resized matrix
+    """
+    if matrix.shape == (n,n):
+        return matrix
+    indptr = np.concatenate([matrix.indptr,np.full(n-matrix.shape[0],matrix.indptr[-1])])
+    return sp.csr_matrix((matrix.data,matrix.indices,indptr),shape=(n,n))
+
+
+class RelationGraphBuilder:
+    """
+    Build the graph of the relations found by a `RelationIdentificationPipeline`. Each pair
+    (relation type, question) has its own sparse weighted adjacency matrix (source -> target),
+    and all matrices share the same node index.
+    """
+    def __init__(self,flush_size=1000000):
+        """
+        RelationGraphBuilder constructor
+
+        Parameters
+        ----------
+        flush_size : int, optional
+            number of pending edges of a matrix above which they are merged into the matrix, by default 1000000
+        """
+        self.flush_size = flush_size
+        self.node_index = {}
+        self.nodes = []
+        self.matrices = {}
+        self._pending = {}
+
+    def node_id(self,node):
+        """
+        Return the id of a node, added to the node index if missing
+        """
+        if not node in self.node_index:
+            self.node_index[node] = len(self.nodes)
+            self.nodes.append(node)
+        return self.node_index[node]
+
+    def add(self,relations,question):
+        """
+        Add relations to the graph
+
+        Parameters
+        ----------
+        relations : iterable
+            relations (source,target,type,...) returned by `RelationIdentificationPipeline.pipe()`
+        question : str
+            question in which the relations were found
+        """
+        for rel in relations:
+            key = (rel[2],question)
+            if not key in self._pending:
+                self._pending[key] = ([],[])
+            rows,cols = self._pending[key]
+            rows.append(self.node_id(rel[0]))
+            cols.append(self.node_id(rel[1]))
+            if len(rows) >= self.flush_size:
+                self._flush(key)
+
+    def add_dataframe(self,df):
+        """
+        Add the relations saved in a DataFrame with the "Question Source Target Type" columns
+        """
+        for question,group in df.groupby("Question"):
+            self.add(group[["Source","Target","Type"]].values,question)
+
+    def _flush(self,key=None):
+        keys = list(self._pending) if key is None else [key]
+        n = len(self.nodes)
+        for k in keys:
+            rows,cols = self._pending.pop(k)
+            new = sp.coo_matrix((np.ones(len(rows)),(rows,cols)),shape=(n,n)).tocsr()
+            if k in self.matrices:
+                new = new + resize_csr(self.matrices[k],n)
+            self.matrices[k] = new
+
+    def keys(self,rel_type=None,question=None):
+        """
+        Return the (relation type, question) pairs matching the given filters
+        """
+        self._flush()
+        return [k for k in self.matrices
+                if (rel_type is None or k[0] == rel_type) and (question is None or k[1] == question)]
+
+    def matrix(self,rel_type=None,question=None):
+        """
+        Return the adjacency matrix summed over the selected relation types and questions
+
+        Parameters
+        ----------
+        rel_type : str, optional
+            relation type, by default None (all)
+        question : str, optional
+            question, by default None (all)
+
+        Returns
+        -------
+        sp.csr_matrix
+            weighted adjacency matrix (source -> target)
+        """
+        n = len(self.nodes)
+        res = sp.csr_matrix((n,n))
+        for k in self.keys(rel_type,question):
+            res = res + resize_csr(self.matrices[k],n)
+        return res
+
+    def degree(self,rel_type=None,question=None,mode="all"):
+        """
+        Return the weighted degree of each node
+
+        Parameters
+        ----------
+        rel_type : str, optional
+            relation type, by default None (all)
+        question : str, optional
+            question, by default None (all)
+        mode : str, optional
+            {"out", "in", "all"}, by default "all"
+
+        Returns
+        -------
+        1D array
+            degree of each node, in the node index order
+        """
+        adj = self.matrix(rel_type,question)
+        out_degree = np.asarray(adj.sum(axis=1)).ravel()
+        in_degree = np.asarray(adj.sum(axis=0)).ravel()
+        if mode == "out":
+            return out_degree
+        if mode == "in":
+            return in_degree
+        return out_degree + in_degree
+
+    def top_neighbors(self,node,k=10,rel_type=None,question=None):
+        """
+        Return the neighbors of a node with the highest edge weights
+
+        Parameters
+        ----------
+        node : str
+            node
+        k : int, optional
+            number of neighbors, by default 10
+        rel_type : str, optional
+            relation type, by default None (all)
+        question : str, optional
+            question, by default None (all)
+
+        Returns
+        -------
+        list of (str, float)
+            neighbors and weights, by decreasing weight
+        """
+        if not node in self.node_index:
+            return []
+        adj = self.matrix(rel_type,question)
+        i = self.node_index[node]
+        weights = np.asarray(adj[i,:].todense()).ravel() + np.asarray(adj[:,i].todense()).ravel()
+        neighbors = np.nonzero(weights)[0]
+        neighbors = neighbors[np.argsort(-weights[neighbors],kind="stable")][:k]
+        return [(self.nodes[j],weights[j]) for j in neighbors]
+
+    def subgraph(self,nodes,rel_type=None,question=None):
+        """
+        Return the adjacency matrix restricted to the given nodes
+
+        Parameters
+        ----------
+        nodes : list of str
+            nodes, ignored if absent from the graph
+        rel_type : str, optional
+            relation type, by default None (all)
+        question : str, optional
+            question, by default None (all)
+
+        Returns
+        -------
+        tuple (sp.csr_matrix, list of str)
+            adjacency matrix and its nodes
+        """
+        nodes = [n for n in nodes if n in self.node_index]
+        idx = [self.node_index[n] for n in nodes]
+        return self.matrix(rel_type,question)[idx,:][:,idx],nodes
+
+    def save(self,prefix):
+        """
+        Save the graph in `<prefix>.npz` (adjacency matrices) and `<prefix>_nodes.txt` (one node per line)
+        """
+        self._flush()
+        n = len(self.nodes)
+        keys = list(self.matrices)
+        arrays = {
+            "types":np.asarray([k[0] for k in keys],dtype=str),
+            "questions":np.asarray([k[1] for k in keys],dtype=str),
+            "n_nodes":np.asarray(n)
+        }
+        for i,k in enumerate(keys):
+            m = resize_csr(self.matrices[k],n)
+            arrays["data_{0}".format(i)] = m.data.astype(np.float32)
+            arrays["indices_{0}".format(i)] = m.indices
+            arrays["indptr_{0}".format(i)] = m.indptr
+        np.savez_compressed("{0}.npz".format(prefix),**arrays)
+        with open("{0}_nodes.txt".format(prefix),"w",encoding="utf-8") as f:
+            for node in self.nodes:
+                f.write("{0}\n".format(node))
+
+    @classmethod
+    def load(cls,prefix):
+        """
+        Load a graph saved with `save()`
+        """
+        graph = cls()
+        with open("{0}_nodes.txt".format(prefix),encoding="utf-8") as f:
+            for line in f:
+                graph.node_id(line.rstrip("\n"))
+        arrays = np.load("{0}.npz".format(prefix))
+        n = int(arrays["n_nodes"])
+        for i,k in enumerate(zip(arrays["types"],arrays["questions"])):
+            graph.matrices[(str(k[0]),str(k[1]))] = sp.csr_matrix(
+                (arrays["data_{0}".format(i)],arrays["indices_{0}".format(i)],arrays["indptr_{0}".format(i)]),shape=(n,n))
+        return graph
@@ -40,9 +40,68 @@ def match_sequences(seqs,dataset):
                     results.append([el[1][1],start,end])
     return results
 
+def single_token_values(patterns):
+    """
+    Return the values of the patterns if every pattern contains a single token, None otherwise
+    
+    Parameters
+    ----------
+    patterns : 2D array [[pat1],[pat2]]
+        patterns
+    
+    Returns
+    -------
+    1D array or None
+        values of the patterns
+    """
+    try:
+        if len(patterns) > 0 and all(len(pat) == 1 and not isinstance(pat,str) for pat in patterns):
+            return np.asarray([pat[0] for pat in patterns])
+    except TypeError:
+        pass
+    return None
+
+def concatenate_docs(docs):
+    """
+    Concatenate Part-Of-Speech outputs of several documents
+    
+    Parameters
+    ----------
+    docs : list of 2D array
+        Post-tags arrays
+    
+    Returns
+    -------
+    tuple (2D array, list of int, list of int)
+        concatenated Post-tags, indices of the concatenated documents (empty documents are left apart)
+        and start position of each of them
+    """
+    docs_ix = [i for i,doc in enumerate(docs) if doc.ndim == 2 and len(doc) > 0]
+    if not docs_ix:
+        return None,[],[]
+    starts = np.cumsum([0]+[len(docs[i]) for i in docs_ix[:-1]])
+    return np.concatenate([docs[i] for i in docs_ix]),docs_ix,starts
+
 class Rule(object):
     def __init__(self):
         pass
+
+    def parse_many(self,docs):
+        """
+        Apply the rule on several documents
+        
+        Parameters
+        ----------
+        docs : list of 2D array (token,tag,lemma)
+            Post-tags arrays
+        
+        Returns
+        -------
+        list of 2D array
+            parsed Post-tags arrays
+        """
+        return [self.parse_tags(doc) for doc in docs]
+
     def parse_tags(self,pos_tags):
         """
         add tag to certains sequence
@@ -91,9 +150,25 @@ class ParsingRule(Rule):
         self.patterns = patterns
         self.new_tag = new_tag
         self.pattern_idx = pattern_idx
+        # Patterns of one token are matched with a single set-membership test
+        self.values = single_token_values(patterns)
+
+    def parse_many(self,docs):
+        if self.values is None:
+            return Rule.parse_many(self,docs)
+        docs = [np.asarray(doc).copy() for doc in docs]
+        tags,docs_ix,starts = concatenate_docs(docs)
+        if tags is None:
+            return docs
+        tags[np.isin(tags[:,self.pattern_idx],self.values),1] = self.new_tag
+        for i,part in zip(docs_ix,np.split(tags,starts[1:])):
+            docs[i] = part
+        return docs
 
     def parse_tags(self,pos_tags):
-        
+        if self.values is not None:
+            return self.parse_many([pos_tags])[0]
+
         tags = np.asarray(pos_tags).copy()
         try:
             ind_seq = np.asarray(match_sequences(dataset=tags[:,self.pattern_idx],seqs=self.patterns))[:,1:3]
@@ -110,6 +185,9 @@ class PruningRule(Rule):
     """
     PruningRule is used to prune tokens that match given patterns. It can be used differently, either the patterns are used to detect tokens that must
     be deleted or kept.
+
+    Every token covered by a match (from its first to its last token) is kept or deleted, once and in the original token order. With
+    `keep_only=True`, a document without any match becomes empty.
     
     """
     def __init__(self,patterns,pattern_idx=0,keep_only=True):
@@ -140,19 +218,39 @@ class PruningRule(Rule):
 
 
         self.keep_only = keep_only
+        # Patterns of one token are matched with a single set-membership test
+        self.values = single_token_values(patterns)
+
+    def parse_many(self,docs):
+        if self.values is None:
+            return Rule.parse_many(self,docs)
+        docs = [np.asarray(doc).copy() for doc in docs]
+        tags,docs_ix,starts = concatenate_docs(docs)
+        if tags is None:
+            return docs
+        keep = np.isin(tags[:,self.pattern_idx],self.values)
+        if not self.keep_only:
+            keep = ~keep
+        # Number of tokens kept before each document start gives the new split positions
+        kept_before = np.concatenate([[0],np.cumsum(keep)])[starts[1:]]
+        for i,part in zip(docs_ix,np.split(tags[keep],kept_before)):
+            docs[i] = part
+        return docs
+
     def parse_tags(self,pos_tags):
+        if self.values is not None:
+            return self.parse_many([pos_tags])[0]
 
         tags = np.asarray(pos_tags).copy()
-        try:
-            indxs = np.asarray(match_sequences(dataset=tags[:,self.pattern_idx],seqs=self.patterns))[:,1]
-            if self.keep_only:
-                tags = tags[indxs]
-            else:
-                tags = np.delete(tags, indxs,axis=0)
-        except IndexError as e:
-            pass
-
-        return tags
+        if tags.ndim != 2:
+            return tags
+        # Same mask as the single-token fast path : every token of each match
+        keep = np.zeros(len(tags),dtype=bool)
+        for _,start,end in match_sequences(dataset=tags[:,self.pattern_idx],seqs=self.patterns):
+            keep[start:end] = True
+        if not self.keep_only:
+            keep = ~keep
+        return tags[keep]
 
 class MergeRule(Rule):
     def __init__(self,tag_to_merge):
@@ -225,6 +323,26 @@ class PipelineParser:
             tags = rule.parse_tags(tags)
         return tags
 
+    def pipe_many(self,docs):
+        """
+        Apply the pipeline on several documents. Rules with a vectorized implementation
+        process all the documents at once.
+        
+        Parameters
+        ----------
+        docs : list of 2D array (token,tag,lemma)
+            Post-tags arrays
+        
+        Returns
+        -------
+        list of 2D array
+            parsed Post-tags arrays
+        """
+        docs = [doc.copy() for doc in docs]
+        for rule in self.rules:
+            docs = rule.parse_many(docs)
+        return docs
+
     @property
     def rules(self): 
         return self.__rules 
@@ -260,13 +378,36 @@ def get_white_space(tagged_text):
     return np.array(tagged_text)
 
 class RelationRule(Rule):
-    def __init__(self,patterns,rule_name,src_position,tar_postion,value_idx=0,pattern_idx=0):
+    def __init__(self,patterns,rule_name,src_position,tar_postion,value_idx=0,pattern_idx=0,anchors=None):
+        """
+        RelationRule constructor
+
+        Parameters
+        ----------
+        patterns : 2D array [[pat1],[pat2]]
+            patterns to match
+        rule_name : str
+            name of the relation type returned
+        src_position : int
+            position of the source token in the matched pattern
+        tar_postion : int
+            position of the target token in the matched pattern
+        value_idx : int, optional
+            column returned for the source and the target, by default 0
+        pattern_idx : int, optional
+            columns in the part-of-speech output used for searching given patterns, by default 0
+        anchors : list of (int, list), optional
+            anchors a tagged document must contain to be a candidate for this rule. Each anchor
+            is a (column, values) pair satisfied if at least one value appears in the column of
+            the raw TreeTagger output, by default None (every document is a candidate)
+        """
         Rule.__init__(self)
         self.patterns = patterns
         self.src_position,self.tar_postion = src_position,tar_postion
         self.pattern_idx = pattern_idx
         self.rule_name=rule_name
         self.value_idx = value_idx
+        self.anchors = anchors
     def parse_tags(self, pos_tags):
         results = []
         
@@ -294,6 +435,25 @@ class RelationIdentificationPipeline:
             relation_occurence_found.extend(r.parse_tags(pos_tags))
         return relation_occurence_found #pd.DataFrame(relation_occurence_found,columns="src tar type".split()) 
 
+    def candidates(self,index):
+        """
+        Return ids of the documents that may match at least one rule of the pipeline
+        
+        Parameters
+        ----------
+        index : TaggedCorpusIndex
+            inverted index built over the tagged documents
+        
+        Returns
+        -------
+        1D array
+            sorted document ids
+        """
+        docs = np.array([],dtype=int)
+        for r in self.rules:
+            docs = np.union1d(docs,index.candidates(r.anchors))
+        return docs
+
     @property
     def rules(self): 
         return self.__rules 
@@ -305,6 +465,96 @@ class RelationIdentificationPipeline:
         self.__rules.append(rule)
 
 
+#----------------------------------------------------------------------------------------------------
+# INVERTED INDEX
+#----------------------------------------------------------------------------------------------------
+
+class TaggedCorpusIndex:
+    """
+    Inverted index from (column, value) ids to the ids of the tagged documents containing them. It is used
+    to send only candidate documents through the parsing and relation identification pipelines.
+    """
+    def __init__(self,columns=(0,1,2)):
+        """
+        TaggedCorpusIndex constructor
+        
+        Parameters
+        ----------
+        columns : tuple of int, optional
+            columns of the part-of-speech output indexed, by default (0,1,2)
+        """
+        self.columns = columns
+        self.vocabulary = {col:{} for col in columns}
+        self.postings = {col:[] for col in columns}
+        self.doc_ids = []
+
+    def add(self,doc_id,pos_tags):
+        """
+        Index a tagged document
+        
+        Parameters
+        ----------
+        doc_id : int
+            document id
+        pos_tags : 2D array (token,tag,lemma)
+            Post-tags array returned by TreeTagger
+        """
+        self.doc_ids.append(doc_id)
+        pos_tags = np.asarray(pos_tags)
+        if pos_tags.ndim != 2:
+            return
+        for col in self.columns:
+            vocab,postings = self.vocabulary[col],self.postings[col]
+            for value in np.unique(pos_tags[:,col]):
+                if not value in vocab:
+                    vocab[value] = len(postings)
+                    postings.append([])
+                postings[vocab[value]].append(doc_id)
+
+    def documents(self,col,values):
+        """
+        Return ids of the documents containing at least one of the values in a column
+        
+        Parameters
+        ----------
+        col : int
+            column of the part-of-speech output
+        values : list
+            values searched
+        
+        Returns
+        -------
+        1D array
+            sorted document ids
+        """
+        vocab,postings = self.vocabulary[col],self.postings[col]
+        hits = [postings[vocab[v]] for v in set(values) if v in vocab]
+        if not hits:
+            return np.array([],dtype=int)
+        return np.unique(np.concatenate(hits))
+
+    def candidates(self,anchors):
+        """
+        Return ids of the documents that contain every anchor
+        
+        Parameters
+        ----------
+        anchors : list of (int, list)
+            (column, values) pairs. If None, every indexed document is returned
+        
+        Returns
+        -------
+        1D array
+            sorted document ids
+        """
+        docs = np.unique(np.asarray(self.doc_ids,dtype=int))
+        if not anchors:
+            return docs
+        for col,values in anchors:
+            docs = np.intersect1d(docs,self.documents(col,values))
+        return docs
+
+
 if __name__ == "__main__":
     from lib.treetagger import TreeTagger
 
@@ -0,0 +1,98 @@
+"""
+Stratified sampling of the responses and estimation of frequencies from a sample
+"""
+
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+
+def stratified_sample(data,by,fraction=None,size=None,seed=42):
+    """
+    Return a random sample of each stratum of a dataset
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        dataset
+    by : str
+        column containing the stratum of each row (e.g. question)
+    fraction : float, optional
+        fraction of each stratum sampled
+    size : int, optional
+        number of rows sampled in each stratum, used if `fraction` is None
+    seed : int, optional
+        random seed, by default 42
+
+    Returns
+    -------
+    pd.DataFrame
+        sample
+
+    Raises
+    ------
+    ValueError
+        If neither `fraction` nor `size` is given
+    """
+    if fraction is None and size is None:
+        raise ValueError("Either fraction or size should be given.")
+    samples = []
+    for _,group in data.groupby(by):
+        n = size if fraction is None else int(np.ceil(fraction*len(group)))
+        samples.append(group.sample(n=min(max(n,1),len(group)),random_state=seed))
+    if not samples:
+        return data.iloc[:0]
+    return pd.concat(samples)
+
+
+def estimate_frequencies(records,population,sample_sizes,item_columns,stratum_column="stratum",
+                         response_column="response",confidence=0.95,by_stratum=False):
+    """
+    Estimate the number of occurrences of each item (relation, keyword, ...) in the full dataset from
+    the occurrences found in a stratified sample.
+
+    Parameters
+    ----------
+    records : pd.DataFrame
+        one row per occurrence found in the sampled responses
+    population : pd.Series
+        number of responses in each stratum of the full dataset
+    sample_sizes : pd.Series
+        number of sampled responses in each stratum
+    item_columns : list of str
+        columns identifying an item
+    stratum_column : str, optional
+        column containing the stratum, by default "stratum"
+    response_column : str, optional
+        column containing the response id, by default "response"
+    confidence : float, optional
+        confidence level of the intervals, by default 0.95
+    by_stratum : bool, optional
+        if True, estimates are given for each stratum, by default False
+
+    Returns
+    -------
+    pd.DataFrame
+        estimate, standard error and confidence interval bounds of the number of occurrences of each item
+    """
+    keys = [stratum_column] + list(item_columns)
+    counts = records.groupby(keys + [response_column]).size().rename("count").reset_index()
+    counts["count2"] = counts["count"]**2
+    stats = counts.groupby(keys)[["count","count2"]].sum().reset_index()
+
+    N = stats[stratum_column].map(population).astype(float)
+    n = stats[stratum_column].map(sample_sizes).astype(float)
+    mean = stats["count"]/n
+    # Sample variance of the count per response, absent responses having a count of 0
+    var = ((stats["count2"] - n*mean**2)/(n-1)).where(n > 1,0.).clip(lower=0)
+    stats["estimate"] = N*mean
+    stats["variance"] = N**2*(1-n/N)*var/n
+
+    group_keys = keys if by_stratum else list(item_columns)
+    res = stats.groupby(group_keys)[["estimate","variance"]].sum()
+    z = NormalDist().inv_cdf(0.5+confidence/2)
+    res["std_error"] = np.sqrt(res["variance"])
+    res["ci_low"] = (res["estimate"] - z*res["std_error"]).clip(lower=0)
+    res["ci_high"] = res["estimate"] + z*res["std_error"]
+    return res.drop(columns="variance").sort_values("estimate",ascending=False).reset_index()